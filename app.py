@@ -1,11 +1,33 @@
 from flask import Flask, render_template_string, request, jsonify, send_from_directory
+from werkzeug.middleware.proxy_fix import ProxyFix
 import os
 from dotenv import load_dotenv
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 import requests
+import faiss
+import numpy as np
+import threading
+import time
+import math
+import json
+import uuid
+import shutil
+import gzip
+import hashlib
+import re
+import atexit
+from urllib.parse import urlparse
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, TimeoutError as FuturesTimeoutError
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 load_dotenv()
 
@@ -13,106 +35,945 @@ app = Flask(__name__)
 
 # Global variables
 embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-vectorstore = None
-retriever = None
-groq_api_key = None
+shards = {}
+index_version = None
+
+# Admission control
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", 4))
+CHAT_MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", 16))
+CHAT_MAX_QUEUE_WAIT = float(os.getenv("CHAT_MAX_QUEUE_WAIT", 5))
+CHAT_RATE_LIMIT = float(os.getenv("CHAT_RATE_LIMIT", 0))
+CHAT_RATE_BURST = float(os.getenv("CHAT_RATE_BURST", 5))
+RATE_LIMIT_MAX_CLIENTS = 10000
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", 0))
+
+chat_slots = threading.BoundedSemaphore(CHAT_MAX_CONCURRENCY)
+queue_lock = threading.Lock()
+queued_requests = 0
+active_requests = 0
+rate_lock = threading.Lock()
+rate_buckets = OrderedDict()
+
+if TRUSTED_PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+
+# Request deadlines
+CHAT_DEADLINE = float(os.getenv("CHAT_DEADLINE", 20))
+RETRIEVAL_MIN_BUDGET = float(os.getenv("RETRIEVAL_MIN_BUDGET", 0.5))
+LLM_MIN_BUDGET = float(os.getenv("LLM_MIN_BUDGET", 2))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", 3))
+LLM_FIRST_TOKEN_LATENCY = float(os.getenv("LLM_FIRST_TOKEN_LATENCY", 0.5))
+LLM_TOKENS_PER_SECOND = float(os.getenv("LLM_TOKENS_PER_SECOND", 250))
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", 1000))
+LLM_MIN_TOKENS = int(os.getenv("LLM_MIN_TOKENS", 150))
+
+# LLM backend routing
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+LLM_EWMA_ALPHA = float(os.getenv("LLM_EWMA_ALPHA", 0.3))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", 100))
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", 0))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+LLM_FAILURE_THRESHOLD = int(os.getenv("LLM_FAILURE_THRESHOLD", 3))
+LLM_FAILURE_COOLDOWN = float(os.getenv("LLM_FAILURE_COOLDOWN", 30))
+LLM_PROBE_INTERVAL = float(os.getenv("LLM_PROBE_INTERVAL", 60))
+LLM_PROBE_TOKENS = int(os.getenv("LLM_PROBE_TOKENS", 16))
+LLM_PROBE_MESSAGES = [{"role": "user", "content": "Reply with the word ok."}]
+
+llm_backends = []
+llm_executor = ThreadPoolExecutor(max_workers=2 * CHAT_MAX_CONCURRENCY)
+# Hedges get their own threads so losers still running never delay the next primary
+hedge_executor = ThreadPoolExecutor(max_workers=CHAT_MAX_CONCURRENCY)
+hedge_slots = threading.BoundedSemaphore(CHAT_MAX_CONCURRENCY)
+recent_routes = deque(maxlen=50)
+
+# Conversation sessions
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", 6))
+SESSION_MAX_TURN_CHARS = int(os.getenv("SESSION_MAX_TURN_CHARS", 2000))
+SESSION_SUMMARY_CHARS = int(os.getenv("SESSION_SUMMARY_CHARS", 1000))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", 5000))
+SESSION_MEMORY_LIMIT = int(os.getenv("SESSION_MEMORY_LIMIT", 32 * 1024 * 1024))
+FOLLOW_UP_MAX_WORDS = 6
+FOLLOW_UP_WORDS = {"it", "its", "that", "this", "those", "these", "they", "them", "one", "ones", "there", "he", "she"}
+
+sessions = OrderedDict()
+sessions_lock = threading.Lock()
+sessions_size = 0
+
+# Vectorstore snapshots
+VECTOR_DB_DIR = os.getenv("VECTOR_DB_DIR", "atomcamp_vector_db")
+INDEX_POINTER_FILE = "CURRENT"
+INDEX_SNAPSHOT_KEEP = int(os.getenv("INDEX_SNAPSHOT_KEEP", 3))
+INDEX_WATCH_INTERVAL = float(os.getenv("INDEX_WATCH_INTERVAL", 30))
+INDEX_WARMUP_QUERY = "What courses does Atomcamp offer?"
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+INDEX_REPORT_FILE = "compression_report.json"
+INDEX_CENTROID_FILE = "centroid.npy"
+
+# Index shards
+DEFAULT_SHARD = "default"
+INDEX_SHARD_BY = os.getenv("INDEX_SHARD_BY", "none")
+INDEX_SHARD_SIZE = int(os.getenv("INDEX_SHARD_SIZE", 5000))
+SHARD_ROUTE_TOP = int(os.getenv("SHARD_ROUTE_TOP", 0))
+SHARD_SEARCH_WORKERS = int(os.getenv("SHARD_SEARCH_WORKERS", 4))
+CONTEXT_CHUNKS = 3
+
+search_executor = ThreadPoolExecutor(max_workers=SHARD_SEARCH_WORKERS)
+
+# Query caches and speculative prefetch
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 2048))
+RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", 2048))
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "true").lower() in ("1", "true", "yes")
+PREFETCH_MIN_CHARS = int(os.getenv("PREFETCH_MIN_CHARS", 8))
+PREFETCH_DEBOUNCE_MS = int(os.getenv("PREFETCH_DEBOUNCE_MS", 300))
+PREFETCH_MAX_ACTIVE = int(os.getenv("PREFETCH_MAX_ACTIVE", max(1, CHAT_MAX_CONCURRENCY // 2)))
+PREFETCH_MAX_PENDING = int(os.getenv("PREFETCH_MAX_PENDING", 4))
+
+prefetch_executor = ThreadPoolExecutor(max_workers=1)
+prefetch_lock = threading.Lock()
+prefetch_tasks = {}
+prefetch_generation = 0
+
+# Request log
+REQUEST_LOG_ENABLED = os.getenv("REQUEST_LOG_ENABLED", "true").lower() in ("1", "true", "yes")
+REQUEST_LOG_DIR = os.getenv("REQUEST_LOG_DIR", "logs")
+REQUEST_LOG_BUFFER = int(os.getenv("REQUEST_LOG_BUFFER", 10000))
+REQUEST_LOG_FLUSH_INTERVAL = float(os.getenv("REQUEST_LOG_FLUSH_INTERVAL", 1))
+REQUEST_LOG_ROTATE_BYTES = int(os.getenv("REQUEST_LOG_ROTATE_BYTES", 64 * 1024 * 1024))
+REQUEST_LOG_KEEP = int(os.getenv("REQUEST_LOG_KEEP", 50))
+
+request_log_buffer = deque(maxlen=REQUEST_LOG_BUFFER)
+request_log_lock = threading.Lock()
+request_log_dropped = 0
+request_log_error = None
+request_log_write_lock = threading.Lock()
+request_log_handle = None
+request_log_written = 0
+
+# Response cache and startup warming
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 512))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 3600))
+WARM_QUERIES_FILE = os.getenv("WARM_QUERIES_FILE", "warm_queries.json")
+WARM_QUERIES_TOP = int(os.getenv("WARM_QUERIES_TOP", 200))
+WARM_RESPONSES_TOP = int(os.getenv("WARM_RESPONSES_TOP", 20))
+
+# Precomputed answers
+ANSWER_INDEX_FILE = os.getenv("ANSWER_INDEX_FILE", "atomcamp_answer_index.npz")
+ANSWER_INDEX_THRESHOLD = float(os.getenv("ANSWER_INDEX_THRESHOLD", 0.92))
+ANSWER_INDEX_CONCURRENCY = int(os.getenv("ANSWER_INDEX_CONCURRENCY", 4))
+ANSWER_INDEX_AUTO_REFRESH = os.getenv("ANSWER_INDEX_AUTO_REFRESH", "true").lower() in ("1", "true", "yes")
+
+answer_index = None
+answer_index_mtime = None
+answer_index_lock = threading.Lock()
+answer_index_error = None
+
+# Vector compression
+INDEX_VECTOR_ENCODING = os.getenv("INDEX_VECTOR_ENCODING", "float32")
+INDEX_PCA_DIM = int(os.getenv("INDEX_PCA_DIM", 0))
+INDEX_EVAL_K = int(os.getenv("INDEX_EVAL_K", 4))
+INDEX_EVAL_FILE = os.getenv("INDEX_EVAL_FILE")
+INDEX_ENCODINGS = {
+    "float32": None,
+    "float16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit
+}
+INDEX_EVAL_QUERIES = [
+    "What courses do you offer?",
+    "Explain machine learning",
+    "How do I get started?",
+    "How long is the beginner track?",
+    "Do you help with job placement?",
+    "Which course teaches SQL?",
+    "What will I learn in the advanced track?",
+    "Is there mentorship?"
+]
+
+index_swap_lock = threading.Lock()
+index_reload_lock = threading.Lock()
+shard_errors = {}
+
+class LRUCache:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+    
+    def put(self, key, value):
+        if self.capacity <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+embedding_cache = LRUCache(EMBEDDING_CACHE_SIZE)
+retrieval_cache = LRUCache(RETRIEVAL_CACHE_SIZE)
+response_cache = LRUCache(RESPONSE_CACHE_SIZE)
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+def read_index_pointer(index_dir):
+    try:
+        with open(os.path.join(index_dir, INDEX_POINTER_FILE)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
 
-def initialize_groq():
-    global groq_api_key
-    groq_api_key = os.getenv("GROQ_API_KEY")
-    return "Groq API key found" if groq_api_key else "Groq API key not found"
+def load_index_snapshot(index_dir):
+    version = read_index_pointer(index_dir)
+    if version is None:
+        # Indexes saved before snapshots were introduced live directly in index_dir
+        store = FAISS.load_local(index_dir, embeddings, allow_dangerous_deserialization=True)
+        return "legacy", store, None
+    
+    path = os.path.join(index_dir, "snapshots", version)
+    store = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+    
+    centroid_path = os.path.join(path, INDEX_CENTROID_FILE)
+    centroid = np.load(centroid_path) if os.path.exists(centroid_path) else None
+    return version, store, centroid
+
+def save_index_snapshot(store, index_dir, report=None, centroid=None):
+    version = time.strftime("%Y%m%d%H%M%S") + "-" + uuid.uuid4().hex[:6]
+    snapshots_dir = os.path.join(index_dir, "snapshots")
+    staging_dir = os.path.join(snapshots_dir, f".{version}.tmp")
+    
+    store.save_local(staging_dir)
+    if report:
+        with open(os.path.join(staging_dir, INDEX_REPORT_FILE), "w") as f:
+            json.dump(report, f, indent=2)
+    if centroid is not None:
+        np.save(os.path.join(staging_dir, INDEX_CENTROID_FILE), centroid)
+    os.rename(staging_dir, os.path.join(snapshots_dir, version))
+    
+    pointer_path = os.path.join(index_dir, INDEX_POINTER_FILE)
+    with open(pointer_path + ".tmp", "w") as f:
+        f.write(version)
+    os.replace(pointer_path + ".tmp", pointer_path)
+    
+    prune_index_snapshots(index_dir, version)
+    return version
+
+def prune_index_snapshots(index_dir, current):
+    snapshots_dir = os.path.join(index_dir, "snapshots")
+    versions = sorted(name for name in os.listdir(snapshots_dir) if not name.startswith("."))
+    for name in versions[:-INDEX_SNAPSHOT_KEEP]:
+        if name != current:
+            shutil.rmtree(os.path.join(snapshots_dir, name), ignore_errors=True)
+
+def index_memory_bytes(index):
+    if isinstance(index, faiss.IndexPreTransform):
+        pca = faiss.downcast_VectorTransform(index.chain.at(0))
+        return index_memory_bytes(faiss.downcast_index(index.index)) + pca.d_in * pca.d_out * 4
+    return index.ntotal * index.sa_code_size()
+
+def compress_vectorstore(store, eval_queries=None):
+    if INDEX_VECTOR_ENCODING not in INDEX_ENCODINGS:
+        raise ValueError(f"INDEX_VECTOR_ENCODING must be one of {', '.join(INDEX_ENCODINGS)}")
+    if INDEX_VECTOR_ENCODING == "float32" and INDEX_PCA_DIM <= 0:
+        return None
+    
+    flat_index = store.index
+    vectors = flat_index.reconstruct_n(0, flat_index.ntotal)
+    dim = flat_index.d
+    
+    pca_skipped_reason = None
+    if 0 < INDEX_PCA_DIM < dim and flat_index.ntotal >= INDEX_PCA_DIM:
+        dim = INDEX_PCA_DIM
+    elif INDEX_PCA_DIM >= dim:
+        pca_skipped_reason = f"INDEX_PCA_DIM must be below {dim}"
+    elif INDEX_PCA_DIM > 0:
+        pca_skipped_reason = f"PCA to {INDEX_PCA_DIM} dimensions needs at least {INDEX_PCA_DIM} vectors, the index has {flat_index.ntotal}"
+    
+    if INDEX_VECTOR_ENCODING == "float32":
+        compressed = faiss.IndexFlat(dim, flat_index.metric_type)
+    else:
+        compressed = faiss.IndexScalarQuantizer(dim, INDEX_ENCODINGS[INDEX_VECTOR_ENCODING], flat_index.metric_type)
+    if dim < flat_index.d:
+        compressed = faiss.IndexPreTransform(faiss.PCAMatrix(flat_index.d, dim), compressed)
+    
+    compressed.train(vectors)
+    compressed.add(vectors)
+    
+    # Measure how many of the exact top-k neighbours survive compression
+    if eval_queries is None and INDEX_EVAL_FILE:
+        with open(INDEX_EVAL_FILE) as f:
+            eval_queries = [line.strip() for line in f if line.strip()]
+    queries = np.array(embeddings.embed_documents(eval_queries or INDEX_EVAL_QUERIES), dtype="float32")
+    k = INDEX_EVAL_K
+    recall = None
+    if flat_index.ntotal > k:
+        _, exact_ids = flat_index.search(queries, k)
+        _, approx_ids = compressed.search(queries, k)
+        hits = sum(len(set(exact) & set(approx)) for exact, approx in zip(exact_ids, approx_ids))
+        recall = hits / max(len(queries) * k, 1)
+    
+    bytes_before = index_memory_bytes(flat_index)
+    bytes_after = index_memory_bytes(compressed)
+    store.index = compressed
+    
+    return {
+        "encoding": INDEX_VECTOR_ENCODING,
+        "dimensions": dim,
+        "original_dimensions": flat_index.d,
+        "pca_requested": INDEX_PCA_DIM,
+        "pca_applied": dim < flat_index.d,
+        "pca_skipped_reason": pca_skipped_reason,
+        "vectors": flat_index.ntotal,
+        "bytes_before": bytes_before,
+        "bytes_after": bytes_after,
+        "memory_saved": 1 - bytes_after / max(bytes_before, 1),
+        "eval_queries": len(queries),
+        "k": k,
+        # With no more vectors than k every neighbour is returned, so recall says nothing
+        "recall": recall
+    }
+
+def load_index_report(index_dir, version):
+    try:
+        with open(os.path.join(index_dir, "snapshots", version, INDEX_REPORT_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
 
-def initialize_vectorstore():
-    global vectorstore, retriever
+def shard_index_dirs():
+    shards_root = os.path.join(VECTOR_DB_DIR, "shards")
+    if os.path.isdir(shards_root):
+        names = sorted(name for name in os.listdir(shards_root) if not name.startswith("."))
+        return {name: os.path.join(shards_root, name) for name in names}
+    return {DEFAULT_SHARD: VECTOR_DB_DIR}
+
+def shard_index_dir(name):
+    if INDEX_SHARD_BY == "none":
+        return VECTOR_DB_DIR
+    return os.path.join(VECTOR_DB_DIR, "shards", name)
+
+def split_into_shards(chunks):
+    if INDEX_SHARD_BY == "size":
+        return {
+            f"part-{start // INDEX_SHARD_SIZE:03d}": chunks[start:start + INDEX_SHARD_SIZE]
+            for start in range(0, len(chunks), INDEX_SHARD_SIZE)
+        }
+    
+    grouped = {}
+    for chunk in chunks:
+        name = DEFAULT_SHARD
+        if INDEX_SHARD_BY == "topic":
+            topic = chunk.metadata.get("topic") or urlparse(chunk.metadata.get("url", "")).path.strip("/").split("/")[0]
+            name = re.sub(r"[^a-z0-9_-]+", "-", topic.lower()).strip("-") or "general"
+        grouped.setdefault(name, []).append(chunk)
+    return grouped
+
+def shard_centroid(store):
+    centroid = store.index.reconstruct_n(0, store.index.ntotal).mean(axis=0)
+    return centroid / (np.linalg.norm(centroid) or 1)
+
+def publish_shard(name, chunks):
+    store = FAISS.from_documents(chunks, embeddings)
+    centroid = shard_centroid(store)
+    report = compress_vectorstore(store)
     
+    index_dir = shard_index_dir(name)
+    version = save_index_snapshot(store, index_dir, report, centroid)
+    swap_shard(name, index_dir, store, version, centroid)
+    return version
+
+def swap_shard(name, index_dir, store, version, centroid):
+    global shards, index_version
+    
+    store.similarity_search(INDEX_WARMUP_QUERY, k=1)
+    
+    # In-flight requests keep the shard map they already hold, so an old
+    # index is released once the last of them finishes
+    with index_swap_lock:
+        updated = dict(shards)
+        updated[name] = {'store': store, 'version': version, 'centroid': centroid, 'index_dir': index_dir}
+        shards = updated
+        index_version = ",".join(f"{key}:{entry['version']}" for key, entry in sorted(updated.items()))
+
+def drop_shard(name):
+    global shards, index_version
+    
+    with index_swap_lock:
+        updated = dict(shards)
+        updated.pop(name, None)
+        shards = updated
+        index_version = ",".join(f"{key}:{entry['version']}" for key, entry in sorted(updated.items()))
+
+def retire_shard(name):
+    # Hide the directory from shard_index_dirs() in one rename before deleting it
+    shards_root = os.path.join(VECTOR_DB_DIR, "shards")
+    retired = os.path.join(shards_root, f".retired-{name}-{uuid.uuid4().hex[:6]}")
+    os.rename(os.path.join(shards_root, name), retired)
+    shutil.rmtree(retired, ignore_errors=True)
+    drop_shard(name)
+
+def reload_vectorstore():
+    if not index_reload_lock.acquire(blocking=False):
+        return False
+    
+    changed = False
     try:
-        vectorstore = FAISS.load_local("atomcamp_vector_db", embeddings, allow_dangerous_deserialization=True)
-        retriever = vectorstore.as_retriever()
-        return "Vectorstore loaded successfully"
-    except:
-        sample_data = [
-            {
-                "text": "Atomcamp is a leading data science education platform offering comprehensive courses in machine learning, Python programming, data analysis, and AI. We provide hands-on projects, expert mentorship, and career guidance to help students become successful data scientists.",
-                "url": "https://www.atomcamp.com/about"
-            },
-            {
-                "text": "Our courses include: Python for Data Science, Machine Learning Fundamentals, Deep Learning with TensorFlow, Data Visualization with Matplotlib and Seaborn, SQL for Data Analysis, Statistics for Data Science, and Advanced AI Techniques.",
-                "url": "https://www.atomcamp.com/courses"
-            },
-            {
-                "text": "Atomcamp offers flexible learning paths: Beginner Track (3 months) - Python basics, data manipulation, basic statistics. Intermediate Track (6 months) - Machine learning, advanced Python, real projects. Advanced Track (9 months) - Deep learning, AI, industry projects, job placement assistance.",
-                "url": "https://www.atomcamp.com/learning-paths"
-            }
-        ]
-        
-        docs = [Document(page_content=item["text"], metadata={"url": item["url"]}) for item in sample_data]
-        splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        chunks = splitter.split_documents(docs)
+        index_dirs = shard_index_dirs()
+        for name, index_dir in index_dirs.items():
+            version = read_index_pointer(index_dir)
+            current = shards.get(name)
+            if version is None or (current and current['version'] == version and current['index_dir'] == index_dir):
+                continue
+            
+            try:
+                loaded_version, store, centroid = load_index_snapshot(index_dir)
+                swap_shard(name, index_dir, store, loaded_version, centroid)
+                shard_errors.pop(name, None)
+                changed = True
+            except Exception as e:
+                # The previous version keeps serving; the error is reported until a load succeeds
+                shard_errors[name] = f"{type(e).__name__}: {e}"
         
-        vectorstore = FAISS.from_documents(chunks, embeddings)
-        vectorstore.save_local("atomcamp_vector_db")
-        retriever = vectorstore.as_retriever()
+        # Shards that left the disk layout are dropped once a real shard is serving,
+        # so an in-memory sample index is not removed before it has a replacement
+        if any(name in shards and shards[name]['version'] != "sample" for name in index_dirs):
+            for name in set(shards) - set(index_dirs):
+                drop_shard(name)
+                changed = True
+        for name in set(shard_errors) - set(index_dirs):
+            shard_errors.pop(name, None)
         
-        return "Sample vectorstore created successfully"
+        if changed and ANSWER_INDEX_AUTO_REFRESH:
+            threading.Thread(target=refresh_answer_index, daemon=True).start()
+        return changed
+    finally:
+        index_reload_lock.release()
+
+def watch_index_pointer():
+    while True:
+        time.sleep(INDEX_WATCH_INTERVAL)
+        reload_vectorstore()
+        reload_answer_index_if_changed()
+
+def select_shards(current, vector):
+    entries = list(current.values())
+    if SHARD_ROUTE_TOP <= 0 or len(entries) <= SHARD_ROUTE_TOP:
+        return entries
+    
+    query = vector / (np.linalg.norm(vector) or 1)
+    # Shards without a centroid cannot be routed and are always searched
+    scored = sorted(
+        entries,
+        key=lambda entry: float(np.dot(entry['centroid'], query)) if entry['centroid'] is not None else float('inf'),
+        reverse=True
+    )
+    return scored[:SHARD_ROUTE_TOP]
+
+def search_shard(entry, vector, k):
+    store = entry['store']
+    query = np.array([vector], dtype=np.float32)
+    _, positions = store.index.search(query, k)
+    
+    results = []
+    for position in positions[0]:
+        if position == -1:
+            continue
+        doc = store.docstore.search(store.index_to_docstore_id[int(position)])
+        # Shards may use different PCA projections, so score in the original
+        # embedding space to keep results from different shards comparable
+        candidate = store.index.reconstruct(int(position))
+        if store.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+            score = float(np.dot(candidate, query[0]))
+        else:
+            score = float(np.sum((candidate - query[0]) ** 2))
+        results.append((doc, score))
+    return results
+
+def embed_query_cached(query, event=None):
+    key = normalize_query(query)
+    vector = embedding_cache.get(key)
+    if event is not None:
+        event['embedding_cache_hit'] = vector is not None
+    if vector is None:
+        vector = embeddings.embed_query(query)
+        embedding_cache.put(key, vector)
+    return vector
+
+def search_index(query, k=CONTEXT_CHUNKS, event=None):
+    with index_swap_lock:
+        current, version = shards, index_version
+    if not current:
+        return []
+    
+    cache_key = (normalize_query(query), k, version)
+    cached = retrieval_cache.get(cache_key)
+    if event is not None:
+        event['retrieval_cache_hit'] = cached is not None
+    if cached is not None:
+        return cached
+    
+    vector = embed_query_cached(query, event)
+    targets = select_shards(current, np.array(vector, dtype="float32"))
+    
+    if len(targets) == 1:
+        results = search_shard(targets[0], vector, k)
+    else:
+        results = []
+        for shard_results in search_executor.map(lambda entry: search_shard(entry, vector, k), targets):
+            results.extend(shard_results)
+    
+    higher_is_better = targets[0]['store'].distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT
+    results.sort(key=lambda pair: pair[1], reverse=higher_is_better)
+    retrieval_cache.put(cache_key, results[:k])
+    return results[:k]
+
+def prefetch_is_current(key, generation):
+    with prefetch_lock:
+        return prefetch_tasks.get(key, (None,))[0] == generation
+
+def run_prefetch(key, generation, query):
+    # Give up as soon as a newer keystroke supersedes this one or real traffic arrives
+    for stage in (embed_query_cached, search_index):
+        if not prefetch_is_current(key, generation) or chat_is_busy():
+            return
+        stage(query)
+
+def schedule_prefetch(key, query):
+    global prefetch_generation
+    
+    with prefetch_lock:
+        previous = prefetch_tasks.get(key)
+        # A client replacing its own prefetch does not grow the queue; new clients
+        # are turned away once a few are already waiting
+        if previous is None and len(prefetch_tasks) >= PREFETCH_MAX_PENDING:
+            return False
+        prefetch_generation += 1
+        generation = prefetch_generation
+        future = prefetch_executor.submit(run_prefetch, key, generation, query)
+        prefetch_tasks[key] = (generation, future)
+    
+    # Cancelling runs done callbacks immediately, so it must happen outside the lock
+    if previous:
+        previous[1].cancel()
+    
+    def forget(done):
+        with prefetch_lock:
+            if prefetch_tasks.get(key, (None,))[0] == generation:
+                del prefetch_tasks[key]
+    future.add_done_callback(forget)
+    return True
+
+def load_index_chunks():
+    chunks = []
+    for name, entry in sorted(shards.items()):
+        store = entry['store']
+        for position in range(store.index.ntotal):
+            chunks.append(store.docstore.search(store.index_to_docstore_id[position]))
+    return chunks
+
+def build_vectorstore(chunks):
+    versions = {}
+    for name, shard_chunks in split_into_shards(chunks).items():
+        versions[name] = publish_shard(name, shard_chunks)
+    
+    # Retire shards the new split no longer produces, only after their replacements are published
+    shards_root = os.path.join(VECTOR_DB_DIR, "shards")
+    if os.path.isdir(shards_root):
+        for name in os.listdir(shards_root):
+            if not name.startswith(".") and (INDEX_SHARD_BY == "none" or name not in versions):
+                retire_shard(name)
+        if INDEX_SHARD_BY == "none" and not os.listdir(shards_root):
+            os.rmdir(shards_root)
+    for name in set(shards) - set(versions):
+        drop_shard(name)
+    return versions
+
+def index_exists(index_dir):
+    return read_index_pointer(index_dir) is not None or os.path.exists(os.path.join(index_dir, "index.faiss"))
+
+def build_sample_vectorstore(publish):
+    sample_data = [
+        {
+            "text": "Atomcamp is a leading data science education platform offering comprehensive courses in machine learning, Python programming, data analysis, and AI. We provide hands-on projects, expert mentorship, and career guidance to help students become successful data scientists.",
+            "url": "https://www.atomcamp.com/about"
+        },
+        {
+            "text": "Our courses include: Python for Data Science, Machine Learning Fundamentals, Deep Learning with TensorFlow, Data Visualization with Matplotlib and Seaborn, SQL for Data Analysis, Statistics for Data Science, and Advanced AI Techniques.",
+            "url": "https://www.atomcamp.com/courses"
+        },
+        {
+            "text": "Atomcamp offers flexible learning paths: Beginner Track (3 months) - Python basics, data manipulation, basic statistics. Intermediate Track (6 months) - Machine learning, advanced Python, real projects. Advanced Track (9 months) - Deep learning, AI, industry projects, job placement assistance.",
+            "url": "https://www.atomcamp.com/learning-paths"
+        }
+    ]
+    
+    docs = [Document(page_content=item["text"], metadata={"url": item["url"]}) for item in sample_data]
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    chunks = splitter.split_documents(docs)
+    
+    if publish:
+        build_vectorstore(chunks)
+        return
+    
+    # Served from memory only; the watcher replaces it once the real index loads
+    for name, shard_chunks in split_into_shards(chunks).items():
+        store = FAISS.from_documents(shard_chunks, embeddings)
+        swap_shard(name, shard_index_dir(name), store, "sample", shard_centroid(store))
 
-def call_groq_api(message, context):
-    global groq_api_key
+def initialize_vectorstore():
+    # Shards without a pointer are still being built for the first time
+    index_dirs = {name: index_dir for name, index_dir in shard_index_dirs().items() if index_exists(index_dir)}
+    for name, index_dir in index_dirs.items():
+        try:
+            version, store, centroid = load_index_snapshot(index_dir)
+            swap_shard(name, index_dir, store, version, centroid)
+        except Exception as e:
+            shard_errors[name] = f"{type(e).__name__}: {e}"
     
-    if not groq_api_key:
-        return None
+    if shards:
+        return "Vectorstore loaded successfully"
     
+    # Sample data is only written to disk when there is no index at all, never
+    # over an index that exists but failed to load in this worker
+    publish = not index_dirs and not os.path.isdir(os.path.join(VECTOR_DB_DIR, "shards"))
+    build_sample_vectorstore(publish)
+    return "Sample vectorstore created successfully"
+
+def get_request_deadline():
+    budget = CHAT_DEADLINE
     try:
-        system_prompt = f"""You are an AI assistant for Atomcamp, a data science education platform. 
-        Use the following context to answer questions about Atomcamp's courses, career services, and data science topics.
-        
-        Context: {context}
-        
-        Guidelines:
-        - Be helpful and informative
-        - Focus on Atomcamp's offerings
-        - Provide specific details when available
-        - Use bullet points for lists
-        - Keep responses concise but comprehensive
-        - Do not use emojis
-        """
-        
-        headers = {
-            "Authorization": f"Bearer {groq_api_key}",
-            "Content-Type": "application/json"
-        }
+        requested = float(request.headers.get('X-Request-Timeout', ''))
+        if requested > 0:
+            budget = min(budget, requested)
+    except ValueError:
+        pass
+    return time.monotonic() + budget
+
+def remaining_budget(deadline):
+    if deadline is None:
+        return float('inf')
+    return deadline - time.monotonic()
+
+def llm_budget(deadline):
+    remaining = remaining_budget(deadline)
+    if remaining < LLM_MIN_BUDGET:
+        return None
+    
+    max_tokens = LLM_MAX_TOKENS
+    if remaining != float('inf'):
+        max_tokens = min(max_tokens, int((remaining - LLM_FIRST_TOKEN_LATENCY) * LLM_TOKENS_PER_SECOND))
+    if max_tokens < LLM_MIN_TOKENS:
+        return None
+    
+    return min(remaining, 30), max_tokens
+
+class LLMBackend:
+    def __init__(self, name, url, model, api_key=None, timeout=30):
+        self.name = name
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.ewma_latency = None
+        self.probe_latency = None
+        self.latencies = deque(maxlen=LLM_LATENCY_WINDOW)
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.last_used = 0
+    
+    def is_healthy(self):
+        return time.monotonic() >= self.unhealthy_until
+    
+    def expected_latency(self):
+        with self.lock:
+            # Short probe answers only stand in until real traffic has been measured
+            latency = self.ewma_latency if self.ewma_latency is not None else self.probe_latency
+            if latency is None:
+                return float('inf')
+            return latency * (1 + self.in_flight)
+    
+    def needs_probe(self):
+        with self.lock:
+            if self.ewma_latency is None and self.probe_latency is None:
+                return True
+            return time.monotonic() - self.last_used > LLM_PROBE_INTERVAL
+    
+    def latency_percentile(self, percentile):
+        with self.lock:
+            if len(self.latencies) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+    
+    def record_success(self, elapsed, probe=False):
+        with self.lock:
+            if probe:
+                self.probe_latency = elapsed
+            elif self.ewma_latency is None:
+                self.ewma_latency = elapsed
+            else:
+                self.ewma_latency += LLM_EWMA_ALPHA * (elapsed - self.ewma_latency)
+            if not probe:
+                self.latencies.append(elapsed)
+            self.consecutive_failures = 0
+            self.unhealthy_until = 0
+    
+    def record_failure(self, elapsed, probe=False):
+        with self.lock:
+            self.errors += 1
+            if not probe:
+                self.latencies.append(elapsed)
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= LLM_FAILURE_THRESHOLD:
+                self.unhealthy_until = time.monotonic() + LLM_FAILURE_COOLDOWN
+    
+    def complete(self, messages, timeout, max_tokens, errors=None, probe=False):
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
         
         data = {
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": message}
-            ],
-            "model": "llama3-8b-8192",
+            "messages": messages,
+            "model": self.model,
             "temperature": 0.7,
-            "max_tokens": 1000
+            "max_tokens": max_tokens
         }
         
-        response = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers=headers,
-            json=data,
-            timeout=30
-        )
+        timeout = min(timeout, self.timeout)
+        connect_timeout = min(LLM_CONNECT_TIMEOUT, timeout / 2)
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.last_used = time.monotonic()
+        start = time.monotonic()
         
-        if response.status_code == 200:
+        try:
+            response = requests.post(
+                self.url,
+                headers=headers,
+                json=data,
+                timeout=(connect_timeout, timeout - connect_timeout)
+            )
+            
+            if response.status_code != 200:
+                self.record_failure(time.monotonic() - start, probe)
+                if errors is not None:
+                    errors.append(f"{self.name}: HTTP {response.status_code}")
+                return None
+            
             result = response.json()
-            return result["choices"][0]["message"]["content"]
-        else:
+            content = result["choices"][0]["message"]["content"]
+            usage = result.get("usage") or {}
+            tokens = usage.get("completion_tokens") or len(content) // 4
+            self.record_success(time.monotonic() - start, probe)
+            return {
+                "content": content,
+                "backend": self.name,
+                "prompt_tokens": usage.get("prompt_tokens"),
+                "completion_tokens": tokens
+            }
+        
+        except Exception as e:
+            self.record_failure(time.monotonic() - start, probe)
+            if errors is not None:
+                errors.append(f"{self.name}: {type(e).__name__}: {e}")
             return None
-            
-    except Exception as e:
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+    
+    def stats(self):
+        with self.lock:
+            return {
+                "name": self.name,
+                "model": self.model,
+                "healthy": time.monotonic() >= self.unhealthy_until,
+                "ewma_latency": self.ewma_latency,
+                "probe_latency": self.probe_latency,
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight
+            }
+
+def parse_llm_backends(config):
+    try:
+        entries = json.loads(config)
+    except ValueError as e:
+        raise ValueError(f"LLM_BACKENDS is not valid JSON: {e}")
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("LLM_BACKENDS must be a non-empty JSON list of backends")
+    
+    backends = []
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not entry.get("model"):
+            raise ValueError(f"LLM_BACKENDS entry {position} must be an object with a \"model\"")
+        
+        api_key = entry.get("api_key")
+        if not api_key and entry.get("api_key_env"):
+            api_key = os.getenv(entry["api_key_env"])
+            if not api_key:
+                raise ValueError(f"LLM_BACKENDS entry {position} needs {entry['api_key_env']}, which is not set")
+        
+        try:
+            timeout = float(entry.get("timeout", 30))
+        except (TypeError, ValueError):
+            timeout = 0
+        if timeout <= 0:
+            raise ValueError(f"LLM_BACKENDS entry {position} has an invalid timeout")
+        
+        backends.append(LLMBackend(
+            entry.get("name", entry["model"]),
+            entry.get("url", GROQ_API_URL),
+            entry["model"],
+            api_key,
+            timeout
+        ))
+    return backends
+
+def initialize_llm_backends():
+    global llm_backends
+    
+    config = os.getenv("LLM_BACKENDS")
+    if config:
+        llm_backends = parse_llm_backends(config)
+    elif os.getenv("GROQ_API_KEY"):
+        llm_backends = [LLMBackend("groq-llama3-8b", GROQ_API_URL, "llama3-8b-8192", os.getenv("GROQ_API_KEY"))]
+    else:
+        llm_backends = []
+    return f"{len(llm_backends)} LLM backends configured"
+
+def probe_backends():
+    while True:
+        for backend in llm_backends:
+            if backend.needs_probe():
+                backend.complete(LLM_PROBE_MESSAGES, backend.timeout, LLM_PROBE_TOKENS, probe=True)
+        time.sleep(LLM_PROBE_INTERVAL)
+
+def rank_backends():
+    healthy = [backend for backend in llm_backends if backend.is_healthy()]
+    return sorted(healthy or llm_backends, key=lambda backend: backend.expected_latency())
+
+def record_route(primary, hedge, winner):
+    recent_routes.append({
+        "time": time.time(),
+        "primary": primary.name,
+        "hedge": hedge.name if hedge else None,
+        "winner": winner.name if winner else None
+    })
+
+def complete_within(backend, messages, timeout, max_tokens, errors=None):
+    # requests only bounds each socket read, so a slowly streamed body is cut off here instead
+    future = llm_executor.submit(backend.complete, messages, timeout, max_tokens, errors)
+    try:
+        return future.result(timeout=timeout)
+    except FuturesTimeoutError:
+        if errors is not None:
+            errors.append(f"{backend.name}: no answer within {timeout:.1f}s")
+        return None
+
+def route_llm_request(messages, deadline=None, errors=None):
+    budget = llm_budget(deadline)
+    if not budget or not llm_backends:
         return None
+    timeout, max_tokens = budget
+    
+    candidates = rank_backends()
+    primary = candidates[0]
+    secondary = candidates[1] if len(candidates) > 1 else None
+    
+    hedge_delay = None
+    if secondary and LLM_HEDGE_PERCENTILE > 0:
+        hedge_delay = primary.latency_percentile(LLM_HEDGE_PERCENTILE)
+    
+    if hedge_delay is None or hedge_delay >= timeout:
+        result = complete_within(primary, messages, timeout, max_tokens, errors)
+        if result or not secondary:
+            record_route(primary, None, primary if result else None)
+            return result
+        
+        # Fail over to the next backend if the budget still allows it
+        budget = llm_budget(deadline)
+        result = complete_within(secondary, messages, *budget, errors) if budget else None
+        record_route(primary, secondary, secondary if result else None)
+        return result
+    
+    futures = {llm_executor.submit(primary.complete, messages, timeout, max_tokens, errors): primary}
+    done, _ = wait(futures, timeout=hedge_delay)
+    
+    hedge = None
+    if not done or not next(iter(done)).result():
+        budget = llm_budget(deadline)
+        # Skip the hedge while every hedge thread is still busy with an earlier loser
+        if budget and hedge_slots.acquire(blocking=False):
+            hedge = secondary
+            future = hedge_executor.submit(secondary.complete, messages, *budget, errors)
+            future.add_done_callback(lambda _: hedge_slots.release())
+            futures[future] = secondary
+    
+    try:
+        for future in as_completed(futures, timeout=max(remaining_budget(deadline), 0)):
+            result = future.result()
+            if result:
+                record_route(primary, hedge, futures[future])
+                return result
+    except FuturesTimeoutError:
+        pass
+    
+    record_route(primary, hedge, None)
+    return None
+
+def call_groq_api(message, context, deadline=None, history=None, summary="", event=None):
+    system_prompt = f"""You are an AI assistant for Atomcamp, a data science education platform. 
+    Use the following context to answer questions about Atomcamp's courses, career services, and data science topics.
+    
+    Context: {context}
+    
+    Guidelines:
+    - Be helpful and informative
+    - Focus on Atomcamp's offerings
+    - Provide specific details when available
+    - Use bullet points for lists
+    - Keep responses concise but comprehensive
+    - Do not use emojis
+    """
+    
+    if summary:
+        system_prompt += f"\n    Earlier in this conversation:\n{summary}\n"
+    
+    messages = [{"role": "system", "content": system_prompt}]
+    messages.extend({"role": turn['role'], "content": turn['content']} for turn in history or [])
+    messages.append({"role": "user", "content": message})
+    
+    errors = []
+    result = route_llm_request(messages, deadline, errors)
+    
+    if event is not None:
+        event['llm_errors'] = errors
+        if result:
+            event['backend'] = result['backend']
+            event['prompt_tokens'] = result['prompt_tokens']
+            event['completion_tokens'] = result['completion_tokens']
+    
+    return result['content'] if result else None
 
-def generate_response(message, context):
-    groq_response = call_groq_api(message, context)
+def generate_response(message, context, deadline=None, history=None, summary="", event=None):
+    groq_response = call_groq_api(message, context, deadline, history, summary, event)
     
     if groq_response:
         return groq_response
     
+    if event is not None:
+        event['fallback'] = True
+    
     # Fallback responses
     message_lower = message.lower()
     
@@ -165,6 +1026,438 @@ Getting Started - How to begin your data science journey
 
 Would you like me to elaborate on any specific aspect?"""
 
+def acquire_chat_slot(timeout):
+    global queued_requests, active_requests
+    
+    with queue_lock:
+        if queued_requests >= CHAT_MAX_QUEUE:
+            return False
+        queued_requests += 1
+    
+    acquired = False
+    try:
+        acquired = chat_slots.acquire(timeout=max(timeout, 0))
+        return acquired
+    finally:
+        with queue_lock:
+            queued_requests -= 1
+            if acquired:
+                active_requests += 1
+
+def release_chat_slot():
+    global active_requests
+    
+    with queue_lock:
+        active_requests -= 1
+    chat_slots.release()
+
+def chat_is_busy():
+    return queued_requests > 0 or active_requests >= PREFETCH_MAX_ACTIVE
+
+def check_rate_limit(client_id):
+    if CHAT_RATE_LIMIT <= 0:
+        return 0
+    
+    now = time.monotonic()
+    with rate_lock:
+        tokens, last = rate_buckets.get(client_id, (CHAT_RATE_BURST, now))
+        tokens = min(CHAT_RATE_BURST, tokens + (now - last) * CHAT_RATE_LIMIT)
+        
+        allowed = tokens >= 1
+        rate_buckets[client_id] = (tokens - 1 if allowed else tokens, now)
+        rate_buckets.move_to_end(client_id)
+        
+        # Forget the clients seen least recently
+        while len(rate_buckets) > RATE_LIMIT_MAX_CLIENTS:
+            rate_buckets.popitem(last=False)
+    
+    return 0 if allowed else (1 - tokens) / CHAT_RATE_LIMIT
+
+def get_client_id():
+    # Behind TRUSTED_PROXY_HOPS proxies, ProxyFix has already resolved remote_addr from X-Forwarded-For
+    return request.remote_addr or 'unknown'
+
+def overloaded_response(message, status, retry_after):
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+def session_entry_size(session):
+    return len(session['summary']) + sum(len(turn['content']) for turn in session['turns'])
+
+def summarize_turn(turn):
+    text = " ".join(turn['content'].split())
+    if turn['role'] == 'user':
+        return f"User asked: {text[:200]}"
+    first_sentence = text.split('. ')[0]
+    return f"Assistant answered: {first_sentence[:200]}"
+
+def get_session(session_id):
+    with sessions_lock:
+        session = sessions.get(session_id)
+        if session is None:
+            return "", []
+        sessions.move_to_end(session_id)
+        return session['summary'], list(session['turns'])
+
+def append_session_turns(session_id, turns):
+    global sessions_size
+    
+    with sessions_lock:
+        session = sessions.pop(session_id, None)
+        if session is None:
+            session = {'summary': "", 'turns': deque(maxlen=SESSION_MAX_TURNS)}
+        else:
+            sessions_size -= session_entry_size(session)
+        
+        for role, content in turns:
+            if len(session['turns']) == session['turns'].maxlen:
+                # Fold the turn about to be evicted into the running summary
+                lines = session['summary'].splitlines() + [summarize_turn(session['turns'][0])]
+                while lines and len("\n".join(lines)) > SESSION_SUMMARY_CHARS:
+                    lines.pop(0)
+                session['summary'] = "\n".join(lines)
+            session['turns'].append({'role': role, 'content': content[:SESSION_MAX_TURN_CHARS]})
+        
+        sessions[session_id] = session
+        sessions_size += session_entry_size(session)
+        
+        while sessions and (len(sessions) > SESSION_MAX_SESSIONS or sessions_size > SESSION_MEMORY_LIMIT):
+            _, evicted = sessions.popitem(last=False)
+            sessions_size -= session_entry_size(evicted)
+
+def build_retrieval_query(message, turns):
+    previous = [turn['content'] for turn in turns if turn['role'] == 'user']
+    if not previous:
+        return message
+    
+    words = [word.strip('?.,!').lower() for word in message.split()]
+    # Only short messages that refer back to something ("how long is it?") borrow the previous question
+    if len(words) <= FOLLOW_UP_MAX_WORDS and any(word in FOLLOW_UP_WORDS for word in words):
+        return f"{previous[-1]} {message}"
+    return message
+
+def record_request_event(event):
+    global request_log_dropped
+    
+    if not REQUEST_LOG_ENABLED:
+        return
+    # The buffer is a ring: when the writer falls behind, the oldest events are overwritten
+    with request_log_lock:
+        if len(request_log_buffer) == request_log_buffer.maxlen:
+            request_log_dropped += 1
+        request_log_buffer.append(event)
+
+def open_request_log():
+    os.makedirs(REQUEST_LOG_DIR, exist_ok=True)
+    name = f"requests-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl.gz"
+    return gzip.open(os.path.join(REQUEST_LOG_DIR, name), "at", encoding="utf-8")
+
+def prune_request_logs():
+    names = sorted(name for name in os.listdir(REQUEST_LOG_DIR) if name.startswith("requests-"))
+    for name in names[:-REQUEST_LOG_KEEP]:
+        try:
+            os.remove(os.path.join(REQUEST_LOG_DIR, name))
+        except OSError:
+            pass
+
+def close_request_log_handle():
+    global request_log_handle
+    
+    if request_log_handle is not None:
+        try:
+            request_log_handle.close()
+        except Exception:
+            pass
+        request_log_handle = None
+
+def flush_request_log():
+    global request_log_handle, request_log_dropped, request_log_error, request_log_written
+    
+    with request_log_write_lock:
+        with request_log_lock:
+            dropped, request_log_dropped = request_log_dropped, 0
+        if not request_log_buffer and not dropped:
+            return
+        
+        event = None
+        try:
+            if request_log_handle is None:
+                request_log_handle = open_request_log()
+                request_log_written = 0
+            
+            # Lost events are reported in the log itself, so gaps in the stream are visible
+            if dropped:
+                marker = {'time': time.time(), 'type': 'dropped', 'count': dropped, 'error': request_log_error}
+                request_log_handle.write(json.dumps(marker) + "\n")
+                dropped = 0
+                request_log_error = None
+            
+            while request_log_buffer:
+                event = request_log_buffer.popleft()
+                line = json.dumps(event, default=str) + "\n"
+                request_log_handle.write(line)
+                request_log_written += len(line)
+                event = None
+            request_log_handle.flush()
+            
+            if request_log_written >= REQUEST_LOG_ROTATE_BYTES:
+                close_request_log_handle()
+                prune_request_logs()
+        except Exception as e:
+            request_log_error = f"{type(e).__name__}: {e}"
+            with request_log_lock:
+                request_log_dropped += dropped + (1 if event is not None else 0)
+            close_request_log_handle()
+
+def write_request_log():
+    while True:
+        time.sleep(REQUEST_LOG_FLUSH_INTERVAL)
+        flush_request_log()
+
+def close_request_log():
+    # Runs at exit: write what is still buffered and finish the gzip stream
+    flush_request_log()
+    with request_log_write_lock:
+        close_request_log_handle()
+
+def message_hash(message):
+    return hashlib.sha256(normalize_query(message).encode("utf-8")).hexdigest()[:16]
+
+def chunk_id(doc):
+    return hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()[:16]
+
+def get_cached_response(key):
+    if key is None:
+        return None
+    entry = response_cache.get(key)
+    if entry and entry[1] > time.monotonic():
+        return entry[0]
+    return None
+
+def put_cached_response(key, response):
+    if key is not None:
+        response_cache.put(key, (response, time.monotonic() + RESPONSE_CACHE_TTL))
+
+def response_cache_key(query):
+    return (normalize_query(query), index_version)
+
+def retrieve_context(query, deadline=None, event=None):
+    if not shards or remaining_budget(deadline) < RETRIEVAL_MIN_BUDGET:
+        return "I'm an AI assistant for Atomcamp, a data science education platform."
+    
+    start = time.monotonic()
+    docs = search_index(query, event=event)
+    
+    if event is not None:
+        event['timings']['retrieval'] = time.monotonic() - start
+        event['retrieved'] = [
+            {'id': chunk_id(doc), 'url': doc.metadata.get('url'), 'score': float(score)}
+            for doc, score in docs
+        ]
+    return "\n\n".join([doc.page_content for doc, score in docs])
+
+def load_warm_queries(path=WARM_QUERIES_FILE):
+    try:
+        with open(path) as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return [entry['query'] if isinstance(entry, dict) else entry for entry in entries]
+
+def warm_caches():
+    for position, query in enumerate(load_warm_queries()[:WARM_QUERIES_TOP]):
+        # Warming is background work and yields to live traffic
+        while chat_is_busy():
+            time.sleep(1)
+        
+        context = retrieve_context(query)
+        key = response_cache_key(query)
+        if position < WARM_RESPONSES_TOP and get_cached_response(key) is None:
+            response = call_groq_api(query, context)
+            if response:
+                put_cached_response(key, response)
+
+def set_answer_index(entries, vectors):
+    global answer_index
+    answer_index = {'entries': entries, 'embeddings': vectors}
+
+def answer_index_file_mtime():
+    try:
+        return os.stat(ANSWER_INDEX_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+def load_answer_index():
+    global answer_index_mtime
+    
+    mtime = answer_index_file_mtime()
+    try:
+        with np.load(ANSWER_INDEX_FILE, allow_pickle=False) as data:
+            entries = json.loads(data["entries"].tobytes().decode("utf-8"))
+            vectors = data["embeddings"].astype(np.float32)
+    except (OSError, ValueError, KeyError):
+        return "Answer index not found"
+    
+    answer_index_mtime = mtime
+    set_answer_index(entries, vectors)
+    return f"Answer index loaded with {len(entries)} answers"
+
+def reload_answer_index_if_changed():
+    mtime = answer_index_file_mtime()
+    if mtime is None or mtime == answer_index_mtime:
+        return False
+    load_answer_index()
+    mark_stale_answers()
+    return True
+
+def save_answer_index(entries, vectors):
+    global answer_index_mtime
+    
+    encoded = np.frombuffer(json.dumps(entries).encode("utf-8"), dtype=np.uint8)
+    staging_path = f"{ANSWER_INDEX_FILE}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(staging_path, "wb") as f:
+        np.savez_compressed(f, entries=encoded, embeddings=vectors.astype(np.float16))
+    os.replace(staging_path, ANSWER_INDEX_FILE)
+    answer_index_mtime = answer_index_file_mtime()
+
+def acquire_answer_index_file_lock(blocking):
+    # Serializes answer regeneration across worker processes; closing the handle releases it
+    handle = open(ANSWER_INDEX_FILE + ".lock", "a")
+    if fcntl is None:
+        return handle
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+def lookup_precomputed_answer(query, event=None):
+    current = answer_index
+    if not current or not current['entries']:
+        return None
+    
+    vector = np.array(embed_query_cached(query, event), dtype=np.float32)
+    similarities = current['embeddings'] @ (vector / (np.linalg.norm(vector) or 1))
+    best = int(np.argmax(similarities))
+    entry = current['entries'][best]
+    
+    if similarities[best] < ANSWER_INDEX_THRESHOLD or entry['stale']:
+        return None
+    if event is not None:
+        event['precomputed_match'] = {'question': entry['question'], 'similarity': float(similarities[best])}
+    return entry['answer']
+
+def generate_answer_entry(question):
+    docs = search_index(question)
+    context = "\n\n".join([doc.page_content for doc, score in docs])
+    answer = call_groq_api(question, context)
+    return {
+        'question': question,
+        'answer': answer,
+        'chunks': [chunk_id(doc) for doc, score in docs],
+        'stale': not answer
+    }
+
+def mark_stale_answers():
+    current = answer_index
+    if not current:
+        return 0
+    
+    # Stop serving answers whose source chunks changed; this only needs retrieval, so every worker does it
+    stale = 0
+    entries = []
+    for entry in current['entries']:
+        if not entry['stale'] and entry['chunks'] != [chunk_id(doc) for doc, score in search_index(entry['question'])]:
+            entry = dict(entry, stale=True)
+        stale += entry['stale']
+        entries.append(entry)
+    set_answer_index(entries, current['embeddings'])
+    return stale
+
+def build_answer_index(questions, concurrency=None, background=False):
+    mark_stale_answers()
+    current = answer_index
+    existing = {}
+    if current:
+        existing = {
+            normalize_query(entry['question']): (entry, vector)
+            for entry, vector in zip(current['entries'], current['embeddings'])
+        }
+    
+    unique = OrderedDict()
+    for question in questions:
+        if question.strip():
+            unique.setdefault(normalize_query(question), question.strip())
+    
+    def build(item):
+        key, question = item
+        entry, vector = existing.get(key, (None, None))
+        if entry and not entry['stale']:
+            return entry, vector
+        if background:
+            # Regeneration inside a serving worker takes a /chat slot, and only while no request is waiting
+            while chat_is_busy() or not chat_slots.acquire(blocking=False):
+                time.sleep(1)
+            try:
+                fresh = generate_answer_entry(question)
+            finally:
+                chat_slots.release()
+        else:
+            fresh = generate_answer_entry(question)
+        # Keep the previous answer unserved when the LLM is unavailable, so a later refresh retries it
+        if fresh['answer'] or not entry:
+            return fresh, None
+        return entry, vector
+    
+    with ThreadPoolExecutor(max_workers=max(1, concurrency or ANSWER_INDEX_CONCURRENCY)) as pool:
+        built = list(pool.map(build, unique.items()))
+    
+    changed = list(unique) != list(existing) or any(vector is None for entry, vector in built)
+    if not built or not changed:
+        return sum(1 for entry, vector in built if not entry['stale'])
+    
+    # Only questions without a stored embedding need to be embedded
+    missing = [position for position, (entry, vector) in enumerate(built) if vector is None]
+    new_vectors = embeddings.embed_documents([built[position][0]['question'] for position in missing]) if missing else []
+    vectors = [vector for entry, vector in built]
+    for position, vector in zip(missing, new_vectors):
+        vector = np.array(vector, dtype=np.float32)
+        vectors[position] = vector / (np.linalg.norm(vector) or 1)
+    
+    entries = [entry for entry, vector in built]
+    vectors = np.array(vectors, dtype=np.float32)
+    save_answer_index(entries, vectors)
+    set_answer_index(entries, vectors)
+    return sum(1 for entry in entries if not entry['stale'])
+
+def refresh_answer_index():
+    global answer_index_error
+    
+    if not answer_index or not answer_index_lock.acquire(blocking=False):
+        return
+    
+    try:
+        if not mark_stale_answers():
+            return
+        
+        # One worker regenerates; the others pick up its file through the index watcher
+        lock_file = acquire_answer_index_file_lock(blocking=False)
+        if lock_file is None:
+            return
+        try:
+            reload_answer_index_if_changed()
+            build_answer_index([entry['question'] for entry in answer_index['entries']], concurrency=1, background=True)
+        finally:
+            lock_file.close()
+        answer_index_error = None
+    except Exception as e:
+        answer_index_error = {'time': time.time(), 'error': f"{type(e).__name__}: {e}"}
+    finally:
+        answer_index_lock.release()
+
 @app.route('/')
 def index():
     html_template = """
@@ -691,6 +1984,11 @@ def index():
         let messages = [];
         let isTyping = false;
         let isConnected = true;
+        let sessionId = null;
+        const CLIENT_TIMEOUT_MS = {{ client_timeout_ms }};
+        const PREFETCH_DEBOUNCE_MS = {{ prefetch_debounce_ms }};
+        const PREFETCH_MIN_CHARS = {{ prefetch_min_chars }};
+        let prefetchTimer = null;
 
         const welcomeScreen = document.getElementById('welcomeScreen');
         const messagesContainer = document.getElementById('messagesContainer');
@@ -704,6 +2002,7 @@ def index():
 
         chatForm.addEventListener('submit', handleSubmit);
         messageInput.addEventListener('input', updateCharCount);
+        messageInput.addEventListener('input', schedulePrefetch);
 
         messageInput.addEventListener('input', () => {
            messageInput.style.height = 'auto';
@@ -715,29 +2014,49 @@ def index():
             charCount.textContent = `${count}/1000`;
         }
 
+        function schedulePrefetch() {
+            clearTimeout(prefetchTimer);
+            const partial = messageInput.value.trim();
+            if (PREFETCH_DEBOUNCE_MS <= 0 || partial.length < PREFETCH_MIN_CHARS || isTyping) return;
+            
+            prefetchTimer = setTimeout(() => {
+                fetch('/prefetch', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ message: partial, session_id: sessionId })
+                }).catch(() => {});
+            }, PREFETCH_DEBOUNCE_MS);
+        }
+
         async function handleSubmit(e) {
             e.preventDefault();
             const message = messageInput.value.trim();
             
             if (!message || isTyping) return;
             
+            clearTimeout(prefetchTimer);
             addMessage(message, 'user');
             messageInput.value = '';
             updateCharCount();
             setTyping(true);
             
+            const controller = new AbortController();
+            const timeoutId = setTimeout(() => controller.abort(), CLIENT_TIMEOUT_MS);
+            
             try {
                 const response = await fetch('/chat', {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ message: message })
+                    body: JSON.stringify({ message: message, session_id: sessionId }),
+                    signal: controller.signal
                 });
                 
                 const data = await response.json();
+                if (data.session_id) {
+                    sessionId = data.session_id;
+                }
                 
-                await new Promise(resolve => setTimeout(resolve, 1200));
-                
-                addMessage(data.response || 'Sorry, I could not generate a response.', 'assistant');
+                addMessage(data.response || data.error || 'Sorry, I could not generate a response.', 'assistant');
                 setConnected(true);
                 
             } catch (error) {
@@ -745,6 +2064,7 @@ def index():
                 setConnected(false);
                 addMessage('I am having trouble connecting. Please try again.', 'assistant');
             } finally {
+                clearTimeout(timeoutId);
                 setTyping(false);
             }
         }
@@ -841,37 +2161,173 @@ def index():
 </body>
 </html>
     """
-    return render_template_string(html_template)
+    return render_template_string(
+        html_template,
+        client_timeout_ms=int((CHAT_DEADLINE + 2) * 1000),
+        prefetch_debounce_ms=PREFETCH_DEBOUNCE_MS if PREFETCH_ENABLED else 0,
+        prefetch_min_chars=PREFETCH_MIN_CHARS
+    )
 
 @app.route('/chat', methods=['POST'])
 def chat():
+    start = time.monotonic()
+    event = {'time': time.time(), 'request_id': uuid.uuid4().hex, 'timings': {}}
+    
+    try:
+        retry_after = check_rate_limit(get_client_id())
+        if retry_after:
+            event['status'] = 429
+            return overloaded_response('Too many requests, please slow down.', 429, retry_after)
+        
+        deadline = get_request_deadline()
+        admitted = acquire_chat_slot(min(CHAT_MAX_QUEUE_WAIT, remaining_budget(deadline)))
+        event['timings']['queue'] = time.monotonic() - start
+        if not admitted:
+            event['status'] = 503
+            return overloaded_response('The assistant is busy, please try again shortly.', 503, CHAT_MAX_QUEUE_WAIT)
+        
+        try:
+            return handle_chat(deadline, event)
+        finally:
+            release_chat_slot()
+    finally:
+        event['timings']['total'] = time.monotonic() - start
+        record_request_event(event)
+
+def handle_chat(deadline, event):
     try:
         data = request.get_json()
         message = data.get('message', '')
         
         if not message:
+            event['status'] = 400
             return jsonify({'error': 'No message provided'}), 400
         
-        if retriever:
-            docs = retriever.get_relevant_documents(message)
-            context = "\n\n".join([doc.page_content for doc in docs[:3]])
-        else:
-            context = "I'm an AI assistant for Atomcamp, a data science education platform."
+        session_id = str(data.get('session_id') or uuid.uuid4().hex)[:64]
+        summary, history = get_session(session_id)
+        query = build_retrieval_query(message, history)
+        event.update({
+            'message_hash': message_hash(message),
+            'message': message,
+            'retrieval_query': query,
+            'session_hash': message_hash(session_id),
+            'history_turns': len(history)
+        })
+        
+        # Only context-free first turns can be answered from precomputed or cached answers
+        cache_key = None if history else response_cache_key(query)
+        response = None if history else lookup_precomputed_answer(query, event)
+        event['precomputed_hit'] = response is not None
+        
+        if response is None:
+            response = get_cached_response(cache_key)
+            event['response_cache_hit'] = response is not None
+        
+        if response is None:
+            context = retrieve_context(query, deadline, event)
+            
+            llm_start = time.monotonic()
+            response = generate_response(message, context, deadline, history, summary, event)
+            event['timings']['llm'] = time.monotonic() - llm_start
+            
+            if not event.get('fallback'):
+                put_cached_response(cache_key, response)
         
-        response = generate_response(message, context)
-        return jsonify({'response': response})
+        # Canned fallback text is not a real answer and must not be replayed to the LLM as history
+        turns = [('user', message)]
+        if not event.get('fallback'):
+            turns.append(('assistant', response))
+        append_session_turns(session_id, turns)
+        event['status'] = 200
+        return jsonify({'response': response, 'session_id': session_id})
         
     except Exception as e:
+        event['status'] = 500
+        event['error'] = f"{type(e).__name__}: {e}"
         return jsonify({'error': f'Error: {str(e)}'}), 500
 
+@app.route('/prefetch', methods=['POST'])
+def prefetch():
+    data = request.get_json(silent=True) or {}
+    message = str(data.get('message', ''))
+    
+    if not PREFETCH_ENABLED or len(message.strip()) < PREFETCH_MIN_CHARS or not shards or chat_is_busy():
+        return jsonify({'prefetched': False}), 202
+    
+    # Prefetches get their own bucket so typing does not use up the client's /chat allowance
+    client_id = get_client_id()
+    retry_after = check_rate_limit(f"prefetch:{client_id}")
+    if retry_after:
+        return overloaded_response('Too many requests, please slow down.', 429, retry_after)
+    
+    session_id = data.get('session_id')
+    summary, history = get_session(str(session_id)[:64]) if session_id else ("", [])
+    scheduled = schedule_prefetch(client_id, build_retrieval_query(message, history))
+    return jsonify({'prefetched': scheduled}), 202
+
+@app.route('/backends')
+def backends():
+    return jsonify({
+        'backends': [backend.stats() for backend in llm_backends],
+        'recent_routes': list(recent_routes)
+    })
+
+@app.route('/index/stats')
+def index_stats():
+    current = shards
+    answers = answer_index
+    return jsonify({
+        'index_version': index_version,
+        'shards': {
+            name: {
+                'version': entry['version'],
+                'vectors': entry['store'].index.ntotal,
+                'memory_bytes': index_memory_bytes(entry['store'].index),
+                'compression': load_index_report(entry['index_dir'], entry['version'])
+            }
+            for name, entry in current.items()
+        },
+        'load_errors': dict(shard_errors),
+        'answer_index': {
+            'entries': len(answers['entries']) if answers else 0,
+            'stale': sum(entry['stale'] for entry in answers['entries']) if answers else 0,
+            'refresh_error': answer_index_error
+        }
+    })
+
+@app.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    if not ADMIN_TOKEN or request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    threading.Thread(target=reload_vectorstore, daemon=True).start()
+    pointers = {name: read_index_pointer(index_dir) for name, index_dir in shard_index_dirs().items()}
+    return jsonify({'index_version': index_version, 'pointers': pointers, 'load_errors': dict(shard_errors)}), 202
+
 @app.route('/static/<path:filename>')
 def static_files(filename):
     return send_from_directory('static', filename)
 
 # Initialize systems
-initialize_groq()
+initialize_llm_backends()
+
+if LLM_PROBE_INTERVAL > 0 and len(llm_backends) > 1:
+    threading.Thread(target=probe_backends, daemon=True).start()
 initialize_vectorstore()
 
+if INDEX_WATCH_INTERVAL > 0:
+    threading.Thread(target=watch_index_pointer, daemon=True).start()
+
+if REQUEST_LOG_ENABLED:
+    threading.Thread(target=write_request_log, daemon=True).start()
+    atexit.register(close_request_log)
+
+threading.Thread(target=warm_caches, daemon=True).start()
+
+load_answer_index()
+if ANSWER_INDEX_AUTO_REFRESH:
+    threading.Thread(target=refresh_answer_index, daemon=True).start()
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 7860))
     app.run(host="0.0.0.0", port=port, debug=False)
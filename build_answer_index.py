@@ -0,0 +1,37 @@
+import argparse
+import os
+
+# Building runs the normal pipeline once per question; skip the server's background work
+os.environ.setdefault("INDEX_WATCH_INTERVAL", "0")
+os.environ.setdefault("REQUEST_LOG_ENABLED", "false")
+os.environ.setdefault("WARM_QUERIES_TOP", "0")
+os.environ.setdefault("ANSWER_INDEX_AUTO_REFRESH", "false")
+
+import app
+
+def read_questions(path):
+    if path.endswith(".json"):
+        return app.load_warm_queries(path)
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute chatbot answers for frequent questions.")
+    parser.add_argument("--questions", default=app.WARM_QUERIES_FILE,
+                        help="text file with one question per line, or a JSON file written by mine_logs.py")
+    parser.add_argument("--top", type=int, default=None, help="only use the first N questions")
+    parser.add_argument("--concurrency", type=int, default=app.ANSWER_INDEX_CONCURRENCY)
+    args = parser.parse_args()
+    
+    questions = read_questions(args.questions)[:args.top]
+    # Wait for any worker that is regenerating answers right now
+    lock_file = app.acquire_answer_index_file_lock(blocking=True)
+    try:
+        app.reload_answer_index_if_changed()
+        answered = app.build_answer_index(questions, args.concurrency)
+    finally:
+        lock_file.close()
+    print(f"Wrote {answered} of {len(questions)} answers to {app.ANSWER_INDEX_FILE}")
+
+if __name__ == "__main__":
+    main()
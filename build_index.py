@@ -0,0 +1,50 @@
+import argparse
+import os
+import sys
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the vector index from its current chunks with the configured encoding and sharding.")
+    parser.add_argument("--encoding", choices=["float32", "float16", "int8"], help="overrides INDEX_VECTOR_ENCODING")
+    parser.add_argument("--pca-dim", type=int, help="overrides INDEX_PCA_DIM")
+    parser.add_argument("--eval-file", help="overrides INDEX_EVAL_FILE")
+    parser.add_argument("--shard", help="rebuild only this shard and leave the others untouched")
+    args = parser.parse_args()
+    
+    # Settings are read when app is imported, so apply overrides first
+    for name, value in (("INDEX_VECTOR_ENCODING", args.encoding), ("INDEX_PCA_DIM", args.pca_dim), ("INDEX_EVAL_FILE", args.eval_file)):
+        if value is not None:
+            os.environ[name] = str(value)
+    for name, value in (("INDEX_WATCH_INTERVAL", "0"), ("REQUEST_LOG_ENABLED", "false"), ("WARM_QUERIES_TOP", "0"),
+                        ("ANSWER_INDEX_AUTO_REFRESH", "false"), ("LLM_PROBE_INTERVAL", "0")):
+        os.environ.setdefault(name, value)
+    
+    import app
+    
+    # Rebuilding from a sample or partially loaded index would overwrite the real content
+    if any(entry['version'] == "sample" for entry in app.shards.values()):
+        sys.exit("No index could be loaded, refusing to publish the sample data. Check VECTOR_DB_DIR.")
+    missing = sorted(name for name, index_dir in app.shard_index_dirs().items()
+                     if app.index_exists(index_dir) and name not in app.shards)
+    if missing:
+        details = "; ".join(f"{name}: {app.shard_errors.get(name, 'not loaded')}" for name in missing)
+        sys.exit(f"Refusing to rebuild, some shards failed to load: {details}")
+    
+    chunks = app.load_index_chunks()
+    if args.shard:
+        groups = app.split_into_shards(chunks)
+        if args.shard not in groups:
+            sys.exit(f"Unknown shard {args.shard!r}, expected one of: {', '.join(sorted(groups))}")
+        versions = {args.shard: app.publish_shard(args.shard, groups[args.shard])}
+    else:
+        versions = app.build_vectorstore(chunks)
+    for name, version in sorted(versions.items()):
+        index_dir = app.shard_index_dir(name)
+        print(f"{name}: snapshot {version} in {index_dir}")
+        report = app.load_index_report(index_dir, version)
+        if report:
+            print(f"  {report['bytes_before']} -> {report['bytes_after']} bytes, recall@{report['k']} {report['recall']}")
+            if report['pca_skipped_reason']:
+                print(f"  PCA skipped: {report['pca_skipped_reason']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import glob
+import gzip
+import json
+import os
+from collections import Counter, defaultdict
+
+def read_events(log_dir):
+    for path in sorted(glob.glob(os.path.join(log_dir, "requests-*.jsonl.gz"))):
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except (OSError, EOFError):
+            # The file currently being written ends mid-stream
+            continue
+
+def top_queries(events, top):
+    counts = Counter()
+    spellings = defaultdict(Counter)
+    
+    for event in events:
+        if event.get("status") != 200 or event.get("history_turns"):
+            continue
+        query = event.get("retrieval_query") or event.get("message")
+        if not query:
+            continue
+        key = " ".join(query.lower().split())
+        counts[key] += 1
+        spellings[key][query.strip()] += 1
+    
+    return [
+        {"query": spellings[key].most_common(1)[0][0], "count": count}
+        for key, count in counts.most_common(top)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the most frequent chatbot questions in the request logs.")
+    parser.add_argument("--log-dir", default=os.getenv("REQUEST_LOG_DIR", "logs"))
+    parser.add_argument("--top", type=int, default=200)
+    parser.add_argument("--output", default=os.getenv("WARM_QUERIES_FILE", "warm_queries.json"))
+    args = parser.parse_args()
+    
+    queries = top_queries(read_events(args.log_dir), args.top)
+    with open(args.output, "w") as f:
+        json.dump(queries, f, indent=2)
+    print(f"Wrote {len(queries)} queries to {args.output}")
+
+if __name__ == "__main__":
+    main()